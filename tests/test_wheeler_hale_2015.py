@@ -39,6 +39,17 @@ def test_get_rgt_1():
     assert(np.isclose(logs[0]['RGT'].values[5], logs[1]['RGT'].values[3]))
     assert(np.isclose(logs[1]['RGT'].values[3], logs[2]['RGT'].values[1]))
 
+def test_get_rgt_median():
+    """Verify that three logs are assigned the correct RGT by the median
+    solver.
+    """
+    logs=[pandas.DataFrame({'d': [0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 2.0, 3.0]}),
+          pandas.DataFrame({'d': [0.0, 0.0, 0.0, 1.0, 2.0, 3.0, 4.0, 5.0]}),
+          pandas.DataFrame({'d': [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0]})]
+    get_rgt(logs, solver='median')
+    assert(np.isclose(logs[0]['RGT'].values[5], logs[1]['RGT'].values[3]))
+    assert(np.isclose(logs[1]['RGT'].values[3], logs[2]['RGT'].values[1]))
+
 def test_get_rgt_2():
     """Verify that three random logs are assigned the correct RGT."""
     np.random.seed(1)
@@ -1,12 +1,14 @@
 """Implementation of Wheeler and Hale's well log aligning using dynamic
 warping.
 """
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import pandas
 import lasio
-import fastdtw
+import numba
 from scipy.optimize import lsq_linear
-from scipy.sparse import csr_matrix
+from scipy.sparse import coo_matrix
+from scipy.spatial.distance import cdist
 
 
 def load_logs(log_files):
@@ -18,14 +20,17 @@ def load_logs(log_files):
     Returns: A list of pandas dataframes, one for each log. This requires
         that pandas is installed.
     """
-    logs = []
-    for log_file in log_files:
-        l = lasio.read(log_file)
-        logs.append(l.df())
-    return logs
+    if len(log_files) == 0:
+        return []
+    # Reading is I/O and parse bound, and lasio releases the GIL during
+    # file I/O, so read the files in parallel
+    with ThreadPoolExecutor(max_workers=min(8, len(log_files))) as executor:
+        return list(executor.map(
+            lambda f: lasio.read(f, ignore_header_errors=True).df(),
+            log_files))
 
 
-def prepare_logs(logs, normalize=True, fillna=True):
+def prepare_logs(logs, normalize=True, fillna=True, seed=None):
     """Prepare the input log files.
 
     Args:
@@ -35,11 +40,13 @@ def prepare_logs(logs, normalize=True, fillna=True):
             median, and has an interquartile range of 1. Default True.
         fillna: An optional boolean indicating whether to fill missing data
             with 0. Default True.
+        seed: An optional int used to seed the random number generator
+            that fills missing data. Default None.
     """
     if normalize:
         _normalize(logs)
     if fillna:
-        _fillna(logs)
+        _fillna(logs, seed)
 
 
 def _normalize(logs):
@@ -49,10 +56,9 @@ def _normalize(logs):
     """
     for l in logs:
         for col in l.columns:
-            cq1 = np.nanpercentile(l[col].values, 25)
-            cq2 = np.nanmedian(l[col].values)
-            cq3 = np.nanpercentile(l[col].values, 75)
-            l[col].values[:] = (l[col].values[:] - cq2) / (cq3 - cq1)
+            vals = l[col].values
+            cq1, cq2, cq3 = np.nanpercentile(vals, [25, 50, 75])
+            l[col] = (vals - cq2) / (cq3 - cq1)
 
 
 #def _fillna(logs):
@@ -61,24 +67,20 @@ def _normalize(logs):
 #        l.fillna(0, inplace=True)
 
 
-def _fillna(logs):
+def _fillna(logs, seed=None):
     """Fill missing data with random values."""
+    rng = np.random.default_rng(seed)
     for l in logs:
         for col in l.columns:
-            for i, v in enumerate(l[col].values):
-                if pandas.isnull(v):
-                    # Shift and scale so random values have median 0 and
-                    # interquartile range 1
-                    l[col].values[i] = (np.random.random() - 0.5) * 2
+            vals = l[col].values.copy()
+            mask = np.isnan(vals)
+            # Shift and scale so random values have median 0 and
+            # interquartile range 1
+            vals[mask] = (rng.random(mask.sum()) - 0.5) * 2
+            l[col] = vals
 
 
-def _np_norm(p):
-    """Return the p-norm of the difference between x and y."""
-    return lambda x, y: np.linalg.norm(x - y, ord=p)
-
-
-def get_rgt(logs, p=1/8.0, radius=1, its=None, path_multiplier=1.5,
-            row_multiplier=2):
+def get_rgt(logs, p=1/8.0, band=None, its=None, solver='lsq'):
     """Find the Relative Geologic Time (RGT) of each depth in each log and
     save this in a new 'RGT' column of each log's dataframe.
 
@@ -86,78 +88,100 @@ def get_rgt(logs, p=1/8.0, radius=1, its=None, path_multiplier=1.5,
         logs: A list of pandas dataframes, one for each log.
         p: A positive int or float specifying the norm to use to measure
             distance between logs. Default 1/8.
-        radius: An int specifying the radius value to pass to FastDTW.
+        band: An optional int specifying the half-width of the Sakoe-Chiba
+            band that the dynamic warping path is constrained to. Default
+            None, which uses 10% of the longest log length (with a minimum
+            of 50).
         its: An optional int specifying how many iterations of the linear
             solver to run. Default None, which will use the default of the
             solver (100).
-        path_multiplier: An optional scalar used to multiply the length of
-            the longest log to estimate the maximum path length. Default 1.5.
-        row_multiplier: An optional scalar used to multiply the length of
-            the longest log to estimate the average number of nonzeros per
-            row of the A matrix, for preallocation. Default 2.
+        solver: An optional string specifying how to turn the aligning
+            paths into RGT. 'lsq' (the default) solves a bounded linear
+            least-squares system for dRGT, ensuring that RGT is always
+            increasing. 'median' assigns each depth the median of the
+            depth indices that the paths align it with, which is much
+            faster but does not enforce that RGT is increasing.
     """
 
-    if isinstance(p, int):
-        distfunc = p
+    dist, paths = _get_path(logs, p, band)
+    if solver == 'lsq':
+        A = _build_A(logs, paths)
+        _solve(A, logs, its)
+    elif solver == 'median':
+        _solve_median(logs, paths)
     else:
-        distfunc = _np_norm(p)
-    dist, path, path_len = _get_path(logs, distfunc, radius, path_multiplier)
-    A = _build_A(logs, path, path_len, row_multiplier)
-    _solve(A, logs, its)
+        raise ValueError('unknown solver {}'.format(solver))
 
 
-def _get_path(logs, distfunc, radius, path_multiplier):
+def _get_path(logs, p, band):
     """Using dynamic warping to determine the path that aligns each pair of
     logs, and its distance.
 
     Args:
         logs: A list of pandas dataframes, one for each log.
-        distfunc: An int or function to use for calculating the distance
-            between two vectors when finding the minimum distance path for
-            dynamic warping. If given an int p, the pth norm will be used.
-            If given a function, the function should accept two vectors
-            (corresponding to the measurements at a certain depths for a
-        radius: An int specifying the radius value to pass to DTW.
-            pair of logs) and return a scalar distance.
-        path_multiplier: An float used to multiply the length of
-            the longest log to estimate the maximum path length.
+        p: A positive int or float specifying the norm to use to measure
+            the distance between the measurements of a pair of logs at a
+            pair of depths.
+        band: An int specifying the half-width of the Sakoe-Chiba band
+            that the dynamic warping path is constrained to, or None to
+            use the default of 10% of the longest log length (with a
+            minimum of 50).
 
     Returns:
-        (With n_logs being the number of logs, and max_path_len being the
-            maximum length of the paths determined by dynamic warping.)
         dist: A (n_logs, n_logs) array of distances between pairs of logs,
             calculated by dynamic warping. Only the upper triangle, excluding
             the main diagonal, is filled (it is symmetric).
-        path: A (n_logs, n_logs, max_path_len) integer array containing the
-            depth indices that align pairs of logs. Log i at depth indices
-            path[i, j, :] should be aligned with log j at depth indices
-            path[j, i, :].
-        path_len: A (n_logs, n_logs) integer array containing the length
-            of the path that aligns pairs of logs. Only the upper triangle,
-            excluding the main diagonal, is filled (it is symmetric).
+        paths: A dict mapping each pair (i, j), with i < j, to a pair of
+            int32 arrays (path1, path2) of equal length, containing the
+            depth indices that align the pair: log i at depth indices
+            path1 should be aligned with log j at depth indices path2.
     """
     max_len_logs = _get_max_len_logs(logs)
-    est_max_path_len = _get_est_max_path_len(max_len_logs, path_multiplier)
     n_logs = len(logs)
+    if band is None:
+        band = max(50, int(0.1 * max_len_logs))
 
     dist = np.zeros([n_logs, n_logs])
-    path_len = np.zeros([n_logs, n_logs], dtype=np.int)
-    path = np.zeros([n_logs, n_logs, est_max_path_len], dtype=np.int)
-    for i, l1 in enumerate(logs[:-1]):
-        l1_cols = set(l1.columns)
-        for j in range(i + 1, len(logs)):
-            l2 = logs[j]
-            l2_cols = set(l2.columns)
-            intersect_cols = list(l1_cols & l2_cols)
-            dist[i, j], path1, path2, path_len[i, j] = \
-                    _dynamic_warping(l1[intersect_cols].values,
-                                     l2[intersect_cols].values,
-                                     distfunc, radius)
-            path[i, j, :len(path1)] = path1
-            path[j, i, :len(path2)] = path2
-
-    path = path[:, :, :np.max(path_len)]
-    return dist, path, path_len
+    paths = {}
+    # Materialize each log's measurements once, as a contiguous float32
+    # array with the columns in sorted order, rather than copying column
+    # data out of pandas for every pair
+    log_cols = [sorted(l.columns) for l in logs]
+    log_arrays = [np.ascontiguousarray(l[cols].values, dtype=np.float32)
+                  for l, cols in zip(logs, log_cols)]
+
+    # Assign each column name a bit in a bitmask, so each pair's column
+    # intersection is a single integer AND with a deterministic order,
+    # and map each log's columns to their indices in its array
+    all_cols = sorted(set().union(*(cols for cols in log_cols)))
+    col_bit = {col: 1 << b for b, col in enumerate(all_cols)}
+    col_mask = [sum(col_bit[col] for col in cols) for cols in log_cols]
+    col_index = [{col: k for k, col in enumerate(cols)}
+                 for cols in log_cols]
+
+    # The pairs are independent, and the DTW kernel releases the GIL, so
+    # dispatch each pair to a thread pool
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {}
+        for i in range(n_logs - 1):
+            for j in range(i + 1, n_logs):
+                intersect_mask = col_mask[i] & col_mask[j]
+                intersect_cols = [col for col in all_cols
+                                  if col_bit[col] & intersect_mask]
+                idx1 = [col_index[i][col] for col in intersect_cols]
+                idx2 = [col_index[j][col] for col in intersect_cols]
+                futures[(i, j)] = \
+                        executor.submit(_dynamic_warping,
+                                        np.ascontiguousarray(
+                                            log_arrays[i][:, idx1]),
+                                        np.ascontiguousarray(
+                                            log_arrays[j][:, idx2]),
+                                        p, band)
+        for (i, j), future in futures.items():
+            dist[i, j], path1, path2 = future.result()
+            paths[i, j] = (path1, path2)
+
+    return dist, paths
 
 
 def _get_max_len_logs(logs):
@@ -169,21 +193,227 @@ def _get_max_len_logs(logs):
     return max_len_logs
 
 
-def _get_est_max_path_len(max_len_logs, path_multiplier):
-    """Estimate the maximum path length from the maximum log length, by
-    approximating that it is 'path_multiplier' times the length.
-    """
-    return int(path_multiplier * max_len_logs)
+def _dynamic_warping(l1, l2, p, band):
+    """Use dynamic warping to find a path that aligns the two input logs."""
+    dist, path1_arr, path2_arr = _banded_dtw(l1, l2, band, p)
+    path_tmp = _chop_repeated(list(zip(path1_arr, path2_arr)))
+    path1 = np.array([p[0] for p in path_tmp], dtype=np.int32)
+    path2 = np.array([p[1] for p in path_tmp], dtype=np.int32)
+    return dist, path1, path2
 
 
-def _dynamic_warping(l1, l2, distfunc, radius):
-    """Use dynamic warping to find a path that aligns the two input logs."""
-    dist, path_tmp = fastdtw.fastdtw(l1, l2, dist=distfunc, radius=radius)
-    path_tmp = _chop_repeated(path_tmp)
-    path1 = [p[0] for p in path_tmp]
-    path2 = [p[1] for p in path_tmp]
-    path_len = len(path_tmp)
-    return dist, path1, path2, path_len
+def _banded_dtw(l1_arr, l2_arr, band, p):
+    """Find the minimum distance path aligning the two input arrays using
+    exact dynamic warping constrained to a Sakoe-Chiba band.
+
+    Args:
+        l1_arr, l2_arr: 2D arrays containing the measurements of a pair of
+            logs, with one row per depth.
+        band: An int specifying the half-width of the band around the
+            main diagonal that the path is constrained to.
+        p: A positive int or float specifying the norm used to measure
+            the distance between a pair of rows.
+
+    Returns:
+        dist: The distance along the minimum distance path.
+        path1, path2: Integer arrays containing the depth indices of the
+            two logs along the path.
+    """
+    n = len(l1_arr)
+    m = len(l2_arr)
+    # The band must be wide enough for a path to reach the final cell
+    band = max(band, abs(n - m) + 1)
+    cost_band = _get_banded_cost_matrix(l1_arr, l2_arr, band, p)
+    D = np.empty((2, cost_band.shape[1]))
+    step = np.empty(cost_band.shape, dtype=np.int8)
+    dist = _dtw_forward(cost_band, band, m, D, step)
+    path1, path2 = _dtw_backtrack(step, band, m)
+    return dist, path1, path2
+
+
+def _get_banded_cost_matrix(l1_arr, l2_arr, band, p):
+    """Compute the part of the cost matrix within the band, stored as a
+    (len1, 2 * band + 1) array in which column j of the full matrix is
+    held at j - i + band, so memory use is O(len1 * band) rather than
+    O(len1 * len2).
+
+    The cost is computed in blocks of rows, each covering only the
+    columns that the block's band touches, so the full matrix is never
+    materialized. Cells outside the band are set to a large value.
+    """
+    n = len(l1_arr)
+    m = len(l2_arr)
+    cost_band = np.full((n, 2 * band + 1), 1e300)
+    block = 512
+    for i0 in range(0, n, block):
+        i1 = min(n, i0 + block)
+        jlo = max(0, i0 - band)
+        jhi = min(m, i1 + band)
+        cost = _get_cost_matrix(l1_arr[i0:i1], l2_arr[jlo:jhi], p)
+        for i in range(i0, i1):
+            rowlo = max(0, i - band)
+            rowhi = min(m, i + band + 1)
+            cost_band[i, rowlo - i + band : rowhi - i + band] = \
+                    cost[i - i0, rowlo - jlo : rowhi - jlo]
+    return cost_band
+
+
+def _get_cost_matrix(l1_arr, l2_arr, p):
+    """Compute the p-norm distance between every pair of rows of the two
+    input arrays.
+
+    The common p values are specialized: 1 and 2 map to cdist's
+    cityblock and squared Euclidean metrics (the latter can be computed
+    with a matrix product, followed by a square root), and the default
+    of 1/8 uses a compiled kernel that evaluates the powers with square
+    roots and squarings, all of which are substantially faster than the
+    generic Minkowski metric.
+    """
+    if p == 1:
+        return cdist(l1_arr, l2_arr, metric='cityblock')
+    if p == 2:
+        cost = cdist(l1_arr, l2_arr, metric='sqeuclidean')
+        return np.sqrt(cost, out=cost)
+    if p == 1/8.0:
+        return _cost_matrix_p125(l1_arr, l2_arr)
+    return cdist(l1_arr, l2_arr, metric='minkowski', p=p)
+
+
+@numba.njit(cache=True, fastmath=True, nogil=True)
+def _cost_matrix_p125(l1_arr, l2_arr):
+    """Compute the 1/8-norm distance between every pair of rows of the two
+    input arrays, evaluating |d| ** (1/8) as three square roots and
+    s ** 8 as three squarings.
+    """
+    cost = np.empty((l1_arr.shape[0], l2_arr.shape[0]))
+    for i in range(l1_arr.shape[0]):
+        for j in range(l2_arr.shape[0]):
+            s = 0.0
+            for c in range(l1_arr.shape[1]):
+                d = abs(l1_arr[i, c] - l2_arr[j, c])
+                s += np.sqrt(np.sqrt(np.sqrt(d)))
+            s2 = s * s
+            s4 = s2 * s2
+            cost[i, j] = s4 * s4
+    return cost
+
+
+@numba.njit(cache=True, fastmath=True, nogil=True)
+def _dtw_forward(cost_band, band, m, D, step):
+    """Run the dynamic warping recurrence on the banded cost matrix and
+    return the distance of the minimum distance path.
+
+    In the banded storage, cell (i, j) of the full matrix is held at
+    (i, j - i + band), so the diagonal, up, and left predecessors of a
+    cell are at banded columns jb, jb + 1, and jb - 1 respectively.
+
+    Args:
+        cost_band: A (len1, 2 * band + 1) float array of distances
+            between pairs of depths, in banded storage.
+        band: An int specifying the half-width of the band.
+        m: An int specifying the length of the second log.
+        D: A preallocated float array of the same width as cost_band,
+            with two rows, used as a ring buffer for the two active rows
+            of the accumulated distance matrix.
+        step: A preallocated int8 array of the same shape as cost_band,
+            which will be filled with the step taken to reach each cell:
+            0 from (i-1, j-1), 1 from (i-1, j), 2 from (i, j-1).
+    """
+    n = cost_band.shape[0]
+    width = cost_band.shape[1]
+    # Large finite value used for cells outside the band
+    big = 1e300
+    D[0, :] = big
+    D[1, :] = big
+    row = 0
+    # Row 0: only left steps are possible
+    D[0, band] = cost_band[0, band]
+    step[0, band] = 0
+    for j in range(1, min(m, band + 1)):
+        jb = j + band
+        D[0, jb] = cost_band[0, jb] + D[0, jb - 1]
+        step[0, jb] = 2
+    for i in range(1, n):
+        prev_row = row
+        row = 1 - row
+        D[row, :] = big
+        jlo = max(0, i - band)
+        jhi = min(m, i + band + 1)
+        # The first cell of the row has no left predecessor in the band
+        jb = jlo - i + band
+        d_diag = D[prev_row, jb] if jlo > 0 else big
+        d_up = D[prev_row, jb + 1] if jb + 1 < width else big
+        d_min = d_diag
+        s_min = 0
+        if d_up < d_min:
+            d_min = d_up
+            s_min = 1
+        D[row, jb] = cost_band[i, jb] + d_min
+        step[i, jb] = s_min
+        # All three predecessors of the interior cells are within the
+        # band, so no boundary branches are needed in the hot loop
+        for j in range(jlo + 1, jhi - 1):
+            jb = j - i + band
+            d_diag = D[prev_row, jb]
+            d_up = D[prev_row, jb + 1]
+            d_left = D[row, jb - 1]
+            d_min = d_diag
+            s_min = 0
+            if d_up < d_min:
+                d_min = d_up
+                s_min = 1
+            if d_left < d_min:
+                d_min = d_left
+                s_min = 2
+            D[row, jb] = cost_band[i, jb] + d_min
+            step[i, jb] = s_min
+        # The last cell of the row has no up predecessor when it is at
+        # the band edge
+        if jhi - 1 > jlo:
+            jb = jhi - 1 - i + band
+            d_diag = D[prev_row, jb]
+            d_up = D[prev_row, jb + 1] if jb + 1 < width else big
+            d_left = D[row, jb - 1]
+            d_min = d_diag
+            s_min = 0
+            if d_up < d_min:
+                d_min = d_up
+                s_min = 1
+            if d_left < d_min:
+                d_min = d_left
+                s_min = 2
+            D[row, jb] = cost_band[i, jb] + d_min
+            step[i, jb] = s_min
+    return D[row, m - 1 - (n - 1) + band]
+
+
+@numba.njit(cache=True, nogil=True)
+def _dtw_backtrack(step, band, m):
+    """Backtrack through the step choices recorded by the forward pass,
+    from the final cell to the first, to produce the minimum distance path.
+    """
+    n = step.shape[0]
+    max_path_len = n + m - 1
+    path1 = np.zeros(max_path_len, dtype=np.int32)
+    path2 = np.zeros(max_path_len, dtype=np.int32)
+    i = n - 1
+    j = m - 1
+    k = max_path_len
+    while True:
+        k -= 1
+        path1[k] = i
+        path2[k] = j
+        if i == 0 and j == 0:
+            break
+        s = step[i, j - i + band]
+        if s == 0:
+            i -= 1
+            j -= 1
+        elif s == 1:
+            i -= 1
+        else:
+            j -= 1
+    return path1[k:], path2[k:]
 
 
 def _chop_repeated(path):
@@ -204,100 +434,137 @@ def _chop_repeated(path):
     return new_path
 
 
-def _build_A(logs, path, path_len, row_multiplier):
+def _build_A(logs, paths):
     """Construct the A matrix for the system of equations that will be solved
     to give dRGT (the depth derivative of RGT) for each log.
+
+    Each path entry k says that the RGT of log i at depth a_k should equal
+    the RGT of log j at depth b_k, where RGT is the cumulative sum of dRGT.
+    Encoding each of these equations directly would sum dRGT from the start
+    of each log, giving O(path_len * log_len) nonzeros per pair. Instead,
+    differencing consecutive path entries gives the equivalent equation
+
+        (RGT_i[a_k] - RGT_i[a_{k-1}]) - (RGT_j[b_k] - RGT_j[b_{k-1}]) = 0,
+
+    which only involves the dRGT entries between consecutive path depths:
+    +1 on entries a_{k-1}+1 to a_k of log i, and -1 on entries b_{k-1}+1
+    to b_k of log j. One additional row per pair keeps the full sums from
+    the start of each log up to the middle path entry, anchoring the
+    cumulative equalities (the middle is used as the path is least
+    reliable near the corners, where it is forced to start and end). The
+    number of nonzeros therefore only grows linearly with log length.
     """
 
-    A_nonzeros, indices, indptr = _allocate_A(path_len, logs, row_multiplier)
+    num_nonzeros, num_rows = _get_A_size(paths)
+    A_nonzeros = np.empty(num_nonzeros)
+    row_idx = np.empty(num_nonzeros, dtype=np.intp)
+    col_idx = np.empty(num_nonzeros, dtype=np.intp)
     cumulative_log_len = _get_cumulative_log_len(logs)
 
-    # initialise number of nonzeros to 0
-    num_nonzero_rows = 0
-    num_nonzero_indices = 0
-
-    for i in range(path.shape[0]-1):
-        for j in range(i + 1, path.shape[0]):
-            for k in range(path_len[i, j]):
-                num_nonzero_indices, num_nonzero_rows = \
-                        _add_row(A_nonzeros, indices, indptr, num_nonzero_rows,
-                                 num_nonzero_indices, cumulative_log_len,
-                                 i, j, k, path, 1.0)
-
-    indptr[num_nonzero_rows] = num_nonzero_indices
-    # chop off the overestimated space at the end
-    A_nonzeros = A_nonzeros[:num_nonzero_indices]
-    indices = indices[:num_nonzero_indices]
-    indptr = indptr[:num_nonzero_rows + 1]
-    A = csr_matrix((A_nonzeros, indices, indptr), dtype=np.float,
-                   shape=(num_nonzero_rows, cumulative_log_len[-1]))
+    nnz = 0
+    row = 0
+    for (i, j), (path1, path2) in paths.items():
+        if len(path1) == 0:
+            continue
+        nnz = _fill_pair_triplets(path1, path2, cumulative_log_len[i],
+                                  cumulative_log_len[j], row, nnz,
+                                  A_nonzeros, row_idx, col_idx)
+        row += len(path1)
+
+    A = coo_matrix((A_nonzeros, (row_idx, col_idx)),
+                   shape=(num_rows, cumulative_log_len[-1])).tocsr()
     return A
 
 
-def _allocate_A(path_len, logs, row_multiplier):
-    """Allocate the arrays necessary to build the sparse A matrix."""
-    num_pairs = np.sum(path_len)
-    num_rows = num_pairs
-    max_len_logs = _get_max_len_logs(logs)
-    # Estimate the average number of nonzeros in a row of the matrix to be
-    # the maximum log length times a multiplier.
-    est_av_num_nonzero_in_row = int(row_multiplier * max_len_logs)
-    est_num_nonzero = num_rows * est_av_num_nonzero_in_row
-
-    A_nonzeros = np.zeros(est_num_nonzero)
-    indices = np.zeros(est_num_nonzero, dtype=np.int)
-    indptr = np.zeros(num_rows + 1, dtype=np.int)
+def _get_A_size(paths):
+    """Return the number of nonzeros and rows in the A matrix.
 
-    return A_nonzeros, indices, indptr
+    Each pair contributes one row per path entry. The differenced rows
+    telescope to the sums from the first to the final path depths, and
+    the anchor row adds the sums from the start of each log to the middle
+    path entry.
+    """
+    num_nonzeros = 0
+    num_rows = 0
+    for path1, path2 in paths.values():
+        plen = len(path1)
+        if plen == 0:
+            continue
+        mid = plen // 2
+        num_nonzeros += (path1[plen - 1] - path1[0]
+                         + path2[plen - 1] - path2[0])
+        num_nonzeros += path1[mid] + path2[mid] + 2
+        num_rows += plen
+    return num_nonzeros, num_rows
+
+
+@numba.njit(cache=True)
+def _fill_pair_triplets(path1, path2, col0_1, col0_2, row, nnz,
+                        A_nonzeros, row_idx, col_idx):
+    """Fill the preallocated COO triplet arrays with one pair's rows of
+    the A matrix, and return the updated number of nonzeros.
+
+    Row 0 of the pair (the anchor) sums both logs' dRGT entries from the
+    start of the log to the middle path entry, and row k > 0 sums the
+    entries between consecutive path depths, with +1 for the first log
+    of the pair and -1 for the second.
+    """
+    plen = len(path1)
+    mid = plen // 2
+    for k in range(plen):
+        if k == 0:
+            a0 = -1
+            b0 = -1
+            a1 = path1[mid]
+            b1 = path2[mid]
+        else:
+            a0 = path1[k - 1]
+            b0 = path2[k - 1]
+            a1 = path1[k]
+            b1 = path2[k]
+        # + sum (from p = a0 + 1 to a1) dRGT[i][p]
+        for col in range(col0_1 + a0 + 1, col0_1 + a1 + 1):
+            A_nonzeros[nnz] = 1.0
+            row_idx[nnz] = row
+            col_idx[nnz] = col
+            nnz += 1
+        # - sum (from p = b0 + 1 to b1) dRGT[j][p]
+        for col in range(col0_2 + b0 + 1, col0_2 + b1 + 1):
+            A_nonzeros[nnz] = -1.0
+            row_idx[nnz] = row
+            col_idx[nnz] = col
+            nnz += 1
+        row += 1
+    return nnz
 
 
 def _get_cumulative_log_len(logs):
-    """Return a list containing a cumulative sum of log length, starting
+    """Return an array containing a cumulative sum of log length, starting
     from 0."""
-    log_len = np.zeros(len(logs), dtype=np.int)
-    for i, log in enumerate(logs):
-        log_len[i] = len(log)
-    return np.append([0], np.cumsum(log_len))
+    return np.concatenate(([0], np.cumsum([len(l) for l in logs]))) \
+             .astype(np.intp)
 
 
-def _add_row(A_nonzeros, indices, indptr, num_nonzero_rows, num_nonzero_indices,
-             cumulative_log_len, i, j, k, path, weight):
-    """Add a row to the A matrix corresponding to one path pair.
+def _solve_median(logs, paths):
+    """Assign each depth of each log the median of the depth indices that
+    the aligning paths map it to, and save this into a new RGT column.
 
-    This sums the dRGT (depth derivative of RGT / change in RGT from previous
-    depth) entries of log i up to the index in the path for that log, and
-    subtracts the sum of the dRGT entries of log j up to the index in the
-    path for that log. This should sum to zero, as they are supposed to
-    have the same RGT, so b=0 when we solve Ax=b.
+    Depths that are aligned should be mapped to similar sets of indices,
+    and so be assigned similar medians. This avoids solving a linear
+    system, but, unlike the least-squares solver, does not enforce that
+    RGT is increasing.
     """
-
-    indptr[num_nonzero_rows] = num_nonzero_indices
-    num_nonzero_rows += 1
-
-    # + sum (from p = 0 to path[i,j,k]) dRGT[i][p]
-    _add_shift_sum(A_nonzeros, indices, num_nonzero_indices,
-                   cumulative_log_len, i, path[i, j, k], +weight)
-    num_nonzero_indices += path[i, j, k] + 1
-
-    # - sum (from p = 0 to path[j,i,k]) dRGT[j][p]
-    _add_shift_sum(A_nonzeros, indices, num_nonzero_indices,
-                   cumulative_log_len, j, path[j, i, k], -weight)
-    num_nonzero_indices += path[j, i, k] + 1
-
-    return num_nonzero_indices, num_nonzero_rows
-
-
-def _add_shift_sum(A_nonzeros, indices, num_nonzero_indices,
-                   cumulative_log_len, logidx, sampleidx, value):
-    """Insert 'value' times the sum of the dRGT values of log 'logidx' up to
-    'sampleidx', into the matrix A.
-    """
-    col0 = cumulative_log_len[logidx]
-    col1 = cumulative_log_len[logidx] + sampleidx
-    idx_range = range(num_nonzero_indices,
-                      num_nonzero_indices + col1 - col0 + 1)
-    indices[idx_range] = np.arange(col0, col1 + 1)
-    A_nonzeros[idx_range] = value
+    n_logs = len(logs)
+    # aligned[i][j] holds the depth index of log j that each depth of
+    # log i is aligned with (NaN where the path does not visit the depth)
+    aligned = [np.full([n_logs, len(l)], np.nan) for l in logs]
+    for i, l in enumerate(logs):
+        aligned[i][i] = np.arange(len(l))
+    for (i, j), (path1, path2) in paths.items():
+        aligned[i][j, path1] = path2
+        aligned[j][i, path2] = path1
+    for i, l in enumerate(logs):
+        l['RGT'] = np.nanmedian(aligned[i], axis=0)
 
 
 def _solve(A, logs, its=None):
@@ -308,8 +575,10 @@ def _solve(A, logs, its=None):
     ensure that RGT is always increasing.
     """
     b = np.zeros(A.shape[0])
+    # The default tolerance (1e-10) spends iterations resolving RGT far
+    # beyond the resolution of the log samples; 1e-3 is sufficient
     res = lsq_linear(A, b, bounds=(1.0, np.inf), verbose=2,
-                     lsmr_tol='auto', max_iter=its)
+                     tol=1e-3, lsmr_tol='auto', max_iter=its)
     _copy_rgt_to_logs(res.x, logs)
 
 
@@ -318,9 +587,10 @@ def _copy_rgt_to_logs(x, logs):
 
     RGT[i] = sum from p = 0 to p = i of dRGT.
     """
+    rgt = np.empty_like(x)
     k = 0
     for l in logs:
         log_len = len(l)
-        rgt = np.cumsum(x[k : k + log_len])
-        l['RGT'] = rgt
+        np.cumsum(x[k : k + log_len], out=rgt[k : k + log_len])
+        l['RGT'] = rgt[k : k + log_len]
         k += log_len